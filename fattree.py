@@ -24,39 +24,56 @@ class FatTree(Topo):
     def __init__(self):
 
 
+        # All counts are integer arithmetic on K; true division would
+        # hand floats to range() and fail under Python 3.
         K = 4
+        half = K // 2
         podNum = K
-        coreSwitchNum = pow((K / 2), 2)
-        aggrSwitchNum = ((K / 2) * K)
-        edgeSwitchNum = ((K / 2) * K)
-        hostNum = (K * pow((K / 2), 2))
+        coreSwitchNum = half * half
+        aggrSwitchNum = half * K
+        edgeSwitchNum = half * K
+        hostNum = K * half * half
 
         Topo.__init__(self)
 
-        coreSwitches = []
-        aggrSwitches = []
-        edgeSwitches = []
-
-        for core in range(0, coreSwitchNum):
-            coreSwitches.append(self.addSwitch("cs_" + str(core)))
-
+        # Precompute every name up front and add nodes, then links, in
+        # single passes. Mininet's Topo graph has no bulk-insert API and
+        # addLink owns port allocation, so the batching happens at the
+        # name and link-tuple level.
+        aggrPerPod = half
+        edgePerPod = half
+        hostsPerEdge = half
+
+        coreSwitches = [self.addSwitch("cs_" + str(core))
+                        for core in range(0, coreSwitchNum)]
+        aggrSwitches = [self.addSwitch("as_" + str(pod) + "_" + str(aggr))
+                        for pod in range(0, podNum)
+                        for aggr in range(0, aggrPerPod)]
+        edgeSwitches = [self.addSwitch("es_" + str(pod) + "_" + str(edge))
+                        for pod in range(0, podNum)
+                        for edge in range(0, edgePerPod)]
+        hosts = [self.addHost("h_" + str(pod) + "_" + str(edge) + "_" + str(x))
+                 for pod in range(0, podNum)
+                 for edge in range(0, edgePerPod)
+                 for x in range(0, hostsPerEdge)]
+
+        links = []
         for pod in range(0, podNum):
-
-            for aggr in range(0, aggrSwitchNum / podNum):
-                aggrThis = self.addSwitch("as_" + str(pod) + "_" + str(aggr))
-                aggrSwitches.append(aggrThis)
-                for x in range((K / 2) * aggr, (K / 2) * (aggr + 1)):
-
-                    self.addLink(aggrThis, coreSwitches[x])
-
-            for edge in range(0, edgeSwitchNum / podNum):
-                edgeThis = self.addSwitch("es_" + str(pod) + "_" + str(edge))
-                edgeSwitches.append(edgeThis)
-                for x in range((edgeSwitchNum / podNum) * pod, ((edgeSwitchNum / podNum) * (pod + 1))):
-                    self.addLink(edgeThis, aggrSwitches[x])
-
-                for x in range(0, (hostNum / podNum / (edgeSwitchNum / podNum))):
-                    self.addLink(edgeThis, self.addHost("h_" + str(pod) + "_" + str(edge) + "_" + str(x)))
+            podAggrs = aggrSwitches[pod * aggrPerPod:(pod + 1) * aggrPerPod]
+            for aggr in range(0, aggrPerPod):
+                aggrThis = podAggrs[aggr]
+                links.extend((aggrThis, core)
+                             for core in coreSwitches[half * aggr:
+                                                      half * (aggr + 1)])
+            for edge in range(0, edgePerPod):
+                edgeThis = edgeSwitches[pod * edgePerPod + edge]
+                links.extend((edgeThis, aggrThat) for aggrThat in podAggrs)
+                edgeHosts = hosts[(pod * edgePerPod + edge) * hostsPerEdge:
+                                  (pod * edgePerPod + edge + 1) * hostsPerEdge]
+                links.extend((edgeThis, host) for host in edgeHosts)
+
+        for src, dst in links:
+            self.addLink(src, dst)
 
 
 topos = {'fattree': (lambda: FatTree())}
\ No newline at end of file
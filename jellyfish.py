@@ -5,7 +5,11 @@ Jellyfish Topology.
 @author Han Lin
 @author Zeyang Zhang
 """
+import logging
 import random
+from collections import defaultdict, deque
+
+import numpy as np
 
 from mininet.log import lg
 from mininet.topo import Topo
@@ -15,6 +19,8 @@ PORT_BASE = 1  # starting index for OpenFlow switch ports
 class JellyfishNodeID(object):
   '''Topo node identifier.'''
 
+  __slots__ = ('switch_id', 'host_id', 'dpid', '_ip', '_mac', '_name')
+
   def __init__(self, switch_id=None, host_id=None, dpid=None, name=None):
     '''Init.
 
@@ -38,37 +44,54 @@ class JellyfishNodeID(object):
       self.host_id = host_id
       self.switch_id = switch_id
       self.dpid = ((self.switch_id) << 8) + (self.host_id)
+    # Derived strings are asked for repeatedly; format them once here.
+    mid = (self.dpid >> 8) & 0xff
+    lo = self.dpid & 0xff
+    self._ip = "10.0.%i.%i" % (mid, lo)
+    self._mac = "00:00:00:00:%02x:%02x" % (mid, lo)
+    if self.host_id == 255:
+      self._name = "s%d" % self.switch_id
+    else:
+      self._name = "h%d" % self.host_id
 
   def __str__(self):
     '''String conversion.
 
     @return str dpid as string
     '''
-    if self.host_id == 255:
-      return "s%d" % self.switch_id
-    else:
-      return "h%d" % self.host_id
+    return self._name
 
   def name_str(self):
     '''Name conversion.
 
     @return name name as string
     '''
-    return str(self)
+    return self._name
 
   def ip_str(self):
     '''Name conversion.
 
     @return ip ip as string
     '''
-    mid = (self.dpid & 0xff00) >> 8
-    lo = self.dpid & 0xff
-    return "10.0.%i.%i" % (mid, lo)
+    return self._ip
 
   def mac_str(self):
-    mid = (self.dpid & 0xff00) >> 8
-    lo = self.dpid & 0xff
-    return "00:00:00:00:%02x:%02x" % (mid, lo)
+    return self._mac
+
+
+def _ids_from_name(name):
+  '''Derive addressing for a node name without building a node ID.
+
+  @param name name of node, e.g. "h3" or "s12"
+  @return (ip, mac, dpid) tuple
+  '''
+  num = int(name[1:])
+  dpid = (num << 8) + (num if name[0] == 'h' else 255)
+  mid = (dpid >> 8) & 0xff
+  lo = dpid & 0xff
+  return ("10.0.%i.%i" % (mid, lo),
+          "00:00:00:00:%02x:%02x" % (mid, lo),
+          dpid)
 
 
 class StructuredNodeSpec(object):
@@ -115,6 +138,9 @@ class StructuredTopo(Topo):
         super(StructuredTopo, self).__init__()
         self.node_specs = node_specs
         self.edge_specs = edge_specs
+        self._layer_cache = {}
+        self._up = {}
+        self._down = {}
 
     def def_nopts(self, layer):
         '''Return default dict for a structured topo.
@@ -124,13 +150,45 @@ class StructuredTopo(Topo):
         '''
         return {'layer': layer}
 
+    def _cache_layers(self):
+        '''Populate the name -> layer cache from node_info.
+
+        Layers are static once the topology is built, so traversal
+        helpers can read this dict instead of indexing node_info twice
+        per neighbor.
+
+        @return cache dict of name -> layer
+        '''
+        self._layer_cache = dict((n, self.node_info[n]['layer'])
+                                 for n in self.g.nodes())
+        return self._layer_cache
+
+    def _finalize_layers(self):
+        '''Precompute the up/down neighbor partition of every node.
+
+        Valid once the topology stops changing; up_nodes and down_nodes
+        then return the shared tuples directly.
+        '''
+        cache = self._cache_layers()
+        for n in self.g.nodes():
+            layer = cache[n]
+            self._up[n] = tuple(m for m in self.g[n]
+                                if cache[m] == layer - 1)
+            self._down[n] = tuple(m for m in self.g[n]
+                                  if cache[m] == layer + 1)
+
     def layer(self, name):
         '''Return layer of a node
 
         @param name name of switch
         @return layer layer of switch
         '''
-        return self.node_info[name]['layer']
+        try:
+            return self._layer_cache[name]
+        except KeyError:
+            layer = self.node_info[name]['layer']
+            self._layer_cache[name] = layer
+            return layer
 
     def isPortUp(self, port):
         ''' Returns whether port is facing up or down
@@ -146,11 +204,10 @@ class StructuredTopo(Topo):
         @param layer layer
         @return names list of names
         '''
-        def is_layer(n):
-            '''Returns true if node is at layer.'''
-            return self.layer(n) == layer
-
-        nodes = [n for n in self.g.nodes() if is_layer(n)]
+        cache = self._layer_cache
+        if len(cache) != len(self.g.nodes()):
+            cache = self._cache_layers()
+        nodes = [n for n in self.g.nodes() if cache[n] == layer]
         return nodes
 
     def up_nodes(self, name):
@@ -160,9 +217,14 @@ class StructuredTopo(Topo):
 
         @return names list of names
         '''
-        layer = self.layer(name) - 1
-        nodes = [n for n in self.g[name] if self.layer(n) == layer]
-        return nodes
+        try:
+            return self._up[name]
+        except KeyError:
+            cache = self._layer_cache
+            if len(cache) != len(self.g.nodes()):
+                cache = self._cache_layers()
+            layer = cache[name] - 1
+            return [n for n in self.g[name] if cache[n] == layer]
 
     def down_nodes(self, name):
         '''Return edges one layer higher (closer to hosts).
@@ -170,9 +232,14 @@ class StructuredTopo(Topo):
         @param name name
         @return names list of names
         '''
-        layer = self.layer(name) + 1
-        nodes = [n for n in self.g[name] if self.layer(n) == layer]
-        return nodes
+        try:
+            return self._down[name]
+        except KeyError:
+            cache = self._layer_cache
+            if len(cache) != len(self.g.nodes()):
+                cache = self._cache_layers()
+            layer = cache[name] + 1
+            return [n for n in self.g[name] if cache[n] == layer]
 
     def up_edges(self, name):
         '''Return edges one layer higher (closer to core).
@@ -209,12 +276,12 @@ class JellyfishTopo(StructuredTopo):
     '''
     d = {'layer': layer}
     if name:
-      id = self.id_gen(name=name)
+      ip, mac, dpid = _ids_from_name(name)
       # For hosts only, set the IP
       if layer == self.LAYER_HOST:
-        d.update({'ip': id.ip_str()})
-        d.update({'mac': id.mac_str()})
-      d.update({'dpid': "%016x" % id.dpid})
+        d.update({'ip': ip})
+        d.update({'mac': mac})
+      d.update({'dpid': "%016x" % dpid})
     return d
 
   def __init__(self, seed=0, switches=16, nodes=4, ports_per_switch=4,
@@ -223,6 +290,7 @@ class JellyfishTopo(StructuredTopo):
     self.bw = bw
     self.id_gen = JellyfishNodeID
     random.seed(seed)
+    np.random.seed(seed)
 
     edge_specs = [StructuredEdgeSpec(bw)] * 3
     node_specs = [StructuredNodeSpec(ports_per_switch - hosts_per_switch,
@@ -234,48 +302,45 @@ class JellyfishTopo(StructuredTopo):
 
     self.create_topology(switches, nodes, ports_per_switch, hosts_per_switch)
 
-  def not_fully_connected(self, switch_list, link_list):
-    for i in range(len(switch_list)):
-      switch = switch_list[i]
-      for j in range(i + 1, len(switch_list)):
-        switch2 = switch_list[j]
-        link = (switch, switch2)
-        if link not in link_list and (switch2, switch) not in link_list:
-          return True
-    return False
-
   def addHosts(self, switches, nodes, ports_per_switch, hosts_per_switch):
+    # Nodes go in first and host links are collected and added in one
+    # pass at the end; Mininet's Topo graph has no bulk-insert API and
+    # addLink owns port allocation, so batching happens at the
+    # name/link-tuple level.
     switch_num = 1
     host_list = []
+    host_links = []
     for num in range(0, nodes):
       host_id = self.id_gen(num+1, num+1).name_str()
       host_opts = self.def_nopts(self.LAYER_HOST, host_id)
-      h = self.addHost(host_id, **host_opts)
-      lg.debug("Adding host: %s\n" % (host_id))
-      host_list.append(h)
+      self.addHost(host_id, **host_opts)
+      lg.debug("Adding host: %s\n", host_id)
+      host_list.append(host_id)
       if num % hosts_per_switch == 0:
         switch_id = self.id_gen(switch_num, 255).name_str()
         switch_opts = self.def_nopts(self.LAYER_EDGE, switch_id)
-        switch = self.addSwitch(switch_id, **switch_opts)
-        lg.debug("Adding switch: %s\n" % (switch_id))
-        for host in host_list:
-          self.addLink(host, switch, bw=self.bw)
-          lg.debug("Adding link: %s to %s\n" % (str(host), str(switch)))
+        self.addSwitch(switch_id, **switch_opts)
+        lg.debug("Adding switch: %s\n", switch_id)
+        host_links.extend((host, switch_id) for host in host_list)
         host_list = []
         switch_num += 1
 
-    for num in range(nodes / hosts_per_switch, switches):
+    for num in range(nodes // hosts_per_switch, switches):
       switch_id = self.id_gen(num+1, 255).name_str()
-      lg.debug("Adding switch: %s\n" % (switch_id))
+      lg.debug("Adding switch: %s\n", switch_id)
       switch_opts = self.def_nopts(self.LAYER_EDGE, switch_id)
-      switch = self.addSwitch(switch_id, **switch_opts)
+      self.addSwitch(switch_id, **switch_opts)
 
-  def count_links_with_switch(self, switch, link_list):
-    count = 0
-    for link in link_list:
-      if switch in link:
-        count += 1
-    return count
+    # Skip the per-link debug calls outright at default verbosity; the
+    # logger defers the %-formatting either way.
+    debug_links = lg.isEnabledFor(logging.DEBUG)
+    for host, switch in host_links:
+      self.addLink(host, switch, bw=self.bw)
+      if debug_links:
+        lg.debug("Adding link: %s to %s\n", host, switch)
+
+  def count_links_with_switch(self, switch):
+    return len(self._adj[switch])
 
   def up_nodes(self, name):
     '''Return edges one layer higher (closer to core).
@@ -284,70 +349,165 @@ class JellyfishTopo(StructuredTopo):
 
     @return names list of names
     '''
-    return [n for n in self.g[name] if self.isSwitch(n)]
+    return [n for n in self.g[name] if n in self._switch_set]
 
-  def down_nodes(self, name):
-    '''Return edges one layer higher (closer to hosts).
-
-    @param name name
-    @return names list of names
-    '''
-    layer = self.layer(name) + 1
-    nodes = [n for n in self.g[name] if self.layer(n) == layer]
-    return nodes
-
-  def switch_is_fully_connected(self, switch, links, switches):
-    for s in switches:
-      if s == switch:
-        continue
-      if (switch, s) not in links or (s, switch) not in links:
-        return False
-    return True
+  def switch_is_fully_connected(self, switch, switches):
+    return self._adj[switch].issuperset(s for s in switches if s != switch)
 
   def create_topology(self, switches, nodes, ports_per_switch, hosts_per_switch):
 
     self.addHosts(switches, nodes, ports_per_switch, hosts_per_switch)
     switch_list = list(self.switches())
     added_links = []
-    while len(switch_list) > 1 and self.not_fully_connected(switch_list, added_links):
-      switch = random.choice(switch_list)
-      switch2 = random.choice(switch_list)
-      if switch == switch2:
-        continue
-      link = (switch, switch2)
-      if link in added_links or (switch2, switch) in added_links:
+    added = set()
+    # Incrementally maintained switch adjacency, so degree and
+    # fully-connected queries never have to scan the link list.
+    self._adj = defaultdict(set)
+    # Ports left on each switch for switch-to-switch links once the
+    # host-facing ports are spoken for.
+    r = ports_per_switch - hosts_per_switch
+    free_ports = dict((sw, r) for sw in switch_list)
+
+    def add_link(s1, s2):
+      added_links.append((s1, s2))
+      added.add(frozenset((s1, s2)))
+      self._adj[s1].add(s2)
+      self._adj[s2].add(s1)
+      free_ports[s1] -= 1
+      free_ports[s2] -= 1
+
+    # Bulk phase: pairing-model construction of the random regular graph.
+    # Shuffle one stub per free port and pair adjacent entries; self
+    # pairs, pairs duplicated within a round and already-added links
+    # throw their stubs back into the pool for the next round.
+    n = len(switch_list)
+    stubs = np.repeat(np.arange(n), max(r, 0))
+    for _ in range(8):
+      if len(stubs) < 2:
+        break
+      np.random.shuffle(stubs)
+      pairs = stubs[:len(stubs) // 2 * 2].reshape(-1, 2)
+      lo = np.minimum(pairs[:, 0], pairs[:, 1])
+      hi = np.maximum(pairs[:, 0], pairs[:, 1])
+      keys = lo * n + hi
+      _, first, counts = np.unique(keys, return_index=True,
+                                   return_counts=True)
+      ok = np.zeros(len(pairs), dtype=bool)
+      ok[first[counts == 1]] = True
+      ok &= lo != hi
+      leftover = [] if len(stubs) % 2 == 0 else [int(stubs[-1])]
+      for row in range(len(pairs)):
+        a, b = int(pairs[row, 0]), int(pairs[row, 1])
+        s1, s2 = switch_list[a], switch_list[b]
+        if ok[row] and frozenset((s1, s2)) not in added:
+          add_link(s1, s2)
+        else:
+          leftover.append(a)
+          leftover.append(b)
+      stubs = np.array(leftover, dtype=stubs.dtype)
+
+    # Residual phase: the few stubs the bulk rounds could not place get
+    # paired one at a time.
+    switch_list = [sw for sw in switch_list if free_ports[sw] > 0]
+    # With at most 64 residual switches every neighbor set fits in one
+    # machine-word int, so the hot fully-connected predicate collapses
+    # to a single mask-and-compare; larger residues keep the set
+    # representation.
+    use_masks = len(switch_list) <= 64
+    active_mask = 0
+    if use_masks:
+      index = dict((sw, i) for i, sw in enumerate(switch_list))
+      masks = [0] * len(switch_list)
+      for sw in switch_list:
+        i = index[sw]
+        for peer in self._adj[sw]:
+          j = index.get(peer)
+          if j is not None:
+            masks[i] |= 1 << j
+      active_mask = (1 << len(switch_list)) - 1
+
+      def fully_connected(sw, active):
+        i = index[sw]
+        return masks[i] & active == active & ~(1 << i)
+    else:
+      def fully_connected(sw, active):
+        return self.switch_is_fully_connected(sw, switch_list)
+
+    # Candidate pairs of still-eligible switches that are not linked yet.
+    # The random phase is done as soon as this hits zero; no rescan needed.
+    remaining_pairs = sum(1 for i, s1 in enumerate(switch_list)
+                          for s2 in switch_list[i + 1:]
+                          if s2 not in self._adj[s1])
+    while len(switch_list) > 1 and remaining_pairs > 0:
+      switch, switch2 = random.sample(switch_list, 2)
+      if frozenset((switch, switch2)) in added:
         continue
-      added_links.append(link)
-      if (self.count_links_with_switch(switch, added_links) == ports_per_switch or
-         self.switch_is_fully_connected(switch, added_links, switch_list)):
+      add_link(switch, switch2)
+      if use_masks:
+        masks[index[switch]] |= 1 << index[switch2]
+        masks[index[switch2]] |= 1 << index[switch]
+      remaining_pairs -= 1
+      if (free_ports[switch] == 0 or
+         fully_connected(switch, active_mask)):
         switch_list.remove(switch)
-      if (self.count_links_with_switch(switch2, added_links) == ports_per_switch or
-         self.switch_is_fully_connected(switch2, added_links, switch_list)):
+        if use_masks:
+          active_mask &= ~(1 << index[switch])
+          remaining_pairs -= bin(active_mask &
+                                 ~masks[index[switch]]).count('1')
+        else:
+          remaining_pairs -= sum(1 for s in switch_list
+                                 if s not in self._adj[switch])
+      if (free_ports[switch2] == 0 or
+         fully_connected(switch2, active_mask)):
         switch_list.remove(switch2)
-
-    print (added_links)
-    print (switch_list)
-    while True:
-      completed = True
-      for switch in switch_list:
-        if self.switch_is_fully_connected(switch, added_links, switch_list):
+        if use_masks:
+          active_mask &= ~(1 << index[switch2])
+          remaining_pairs -= bin(active_mask &
+                                 ~masks[index[switch2]]).count('1')
+        else:
+          remaining_pairs -= sum(1 for s in switch_list
+                                 if s not in self._adj[switch2])
+
+    lg.debug("Links after random phase: %s\n", added_links)
+    lg.debug("Unsaturated switches: %s\n", switch_list)
+    # Patch phase: a switch left with two or more free ports absorbs an
+    # existing link (x, y), replacing it with (switch, x) and
+    # (switch, y). Work a queue of port-starved switches, one absorption
+    # per turn; a switch is requeued only while it still holds two free
+    # ports, so the total work is linear in the number of swaps.
+    todo = deque(sw for sw in switch_list if free_ports[sw] >= 2)
+    while todo and added_links:
+      switch = todo.popleft()
+      for _ in range(len(added_links)):
+        idx = random.randrange(len(added_links))
+        x, y = added_links[idx]
+        if (switch == x or switch == y or
+            x in self._adj[switch] or y in self._adj[switch]):
           continue
-        if self.count_links_with_switch(switch, added_links) < (ports_per_switch-1):
-          completed = False
-          link = random.choice(added_links)
-          if switch == link [0] or switch == link[1]:
-            continue
-          new_link1 = (switch, link[0])
-          new_link2 = (switch, link[1])
-          added_links.remove(link)
-          added_links.append(new_link1)
-          added_links.append(new_link2)
-      if completed:
+        # Swap-remove: order of added_links is irrelevant, so fill the
+        # hole with the last entry instead of shifting the tail.
+        added_links[idx] = added_links[-1]
+        added_links.pop()
+        added.discard(frozenset((x, y)))
+        self._adj[x].discard(y)
+        self._adj[y].discard(x)
+        free_ports[x] += 1
+        free_ports[y] += 1
+        add_link(switch, x)
+        add_link(switch, y)
+        if free_ports[switch] >= 2:
+          todo.append(switch)
         break
+      # A switch with no absorbable link simply falls out of the queue.
 
     for link in added_links:
       self.addLink(link[0], link[1], bw=self.bw)
 
+    # The topology is immutable from here on; freeze lookups the
+    # traversal helpers lean on.
+    self._switch_set = frozenset(self.switches())
+    self._finalize_layers()
+
 topos = {'jellyfish': JellyfishTopo}
 
 if __name__ == '__main__':